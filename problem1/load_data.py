@@ -1,8 +1,10 @@
 import psycopg2
+from psycopg2 import sql
 import csv
 import os
+import re
 import argparse
-from psycopg2.extras import execute_batch
+from concurrent.futures import ProcessPoolExecutor
 
 def connect(args):
     return psycopg2.connect(
@@ -13,88 +15,196 @@ def connect(args):
         port=args.port
     )
 
+def tune_session(conn):
+    # bulk-load settings, scoped to this connection only
+    with conn.cursor() as cur:
+        cur.execute("SET maintenance_work_mem = '1GB'")
+        cur.execute("SET synchronous_commit = off")
+    conn.commit()
+
 def run_schema(conn, schema_path):
     with conn.cursor() as cur, open(schema_path, encoding="utf-8") as f:
         cur.execute(f.read())
     conn.commit()
 
+CREATE_INDEX = re.compile(r"^CREATE INDEX (\w+) .*?;", re.M)
+
+def drop_indexes(conn, schema_path):
+    # schema.sql stays complete for plain psql runs; the loader drops its secondary
+    # indexes so COPY does not maintain them row by row, and rebuilds them afterwards
+    with open(schema_path, encoding="utf-8") as f:
+        indexes = CREATE_INDEX.findall(f.read())
+    with conn.cursor() as cur:
+        for name in indexes:
+            cur.execute(sql.SQL("DROP INDEX IF EXISTS {}").format(sql.Identifier(name)))
+    conn.commit()
+
+def create_indexes(conn, schema_path):
+    with open(schema_path, encoding="utf-8") as f:
+        statements = [m.group(0) for m in CREATE_INDEX.finditer(f.read())]
+    with conn.cursor() as cur:
+        for stmt in statements:
+            cur.execute(stmt)
+        cur.execute("ANALYZE")
+    conn.commit()
+
+BLANK_LINE = re.compile(rb"^\r?\n", re.M)
+
+def read_header(f):
+    return next(csv.reader([f.readline().decode("utf-8")]))
+
+class CopyReader:
+    """Binary file reader for COPY that drops empty lines outside quoted fields (csv.DictReader skipped them) and stops at byte offset `end`."""
+
+    def __init__(self, f, end=None):
+        self._f = f
+        self._end = end
+        self._tail = b""
+        self._quoted = False
+
+    def _read(self, size):
+        n = size
+        if self._end is not None:
+            left = max(self._end - self._f.tell(), 0)
+            n = left if size < 0 else min(size, left)
+        return self._f.read(n)
+
+    def _drop_blank(self, lines):
+        # lines holds whole lines only; a quoted field may span several of them
+        if not self._quoted and b'"' not in lines:
+            return BLANK_LINE.sub(b"", lines)
+        out = []
+        for line in lines[:-1].split(b"\n"):
+            if self._quoted or line not in (b"", b"\r"):
+                out.append(line + b"\n")
+            if line.count(b'"') % 2:
+                self._quoted = not self._quoted
+        return b"".join(out)
+
+    def read(self, size=-1):
+        while True:
+            chunk = self._read(size)
+            if not chunk:
+                tail, self._tail = self._tail, b""
+                return tail if self._quoted or tail not in (b"", b"\r") else b""
+            data = self._tail + chunk
+            # hold back the unfinished last line (even a lone \r) until its newline arrives
+            cut = data.rfind(b"\n") + 1
+            self._tail = data[cut:]
+            data = self._drop_blank(data[:cut]) if cut else b""
+            if data:
+                return data
+
+def stage_csv(cur, name, header, f):
+    # text-typed temp table shaped like the CSV; COPY reads the rest of f straight in
+    # and the INSERT ... SELECT that follows does the casts and name -> id joins in SQL
+    cols = sql.SQL(", ").join(sql.SQL("{} text").format(sql.Identifier(c)) for c in header)
+    cur.execute(sql.SQL("CREATE TEMP TABLE {} ({}) ON COMMIT DROP").format(sql.Identifier(name), cols))
+    cur.copy_expert(f"COPY {name} FROM STDIN WITH (FORMAT CSV)", f)
+    return cur.rowcount
+
 def load_lines(conn, path):
-    with conn.cursor() as cur, open(path, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        rows = [(r["line_name"], r["vehicle_type"]) for r in reader]
-        execute_batch(cur, """
+    with conn.cursor() as cur, open(path, "rb") as f:
+        n = stage_csv(cur, "lines_raw", read_header(f), CopyReader(f))
+        cur.execute("""
             INSERT INTO lines (line_name, vehicle_type)
-            VALUES (%s, %s)
+            SELECT line_name, vehicle_type FROM lines_raw
             ON CONFLICT (line_name) DO NOTHING
-        """, rows)
-        cur.execute("SELECT line_id, line_name FROM lines")
-        mapping = {name: lid for lid, name in cur.fetchall()}
+        """)
     conn.commit()
-    return len(rows), mapping
+    return n
 
 def load_stops(conn, path):
-    with conn.cursor() as cur, open(path, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        rows = [(r["stop_name"], float(r["latitude"]), float(r["longitude"])) for r in reader]
-        execute_batch(cur, """
+    with conn.cursor() as cur, open(path, "rb") as f:
+        n = stage_csv(cur, "stops_raw", read_header(f), CopyReader(f))
+        cur.execute("""
             INSERT INTO stops (stop_name, latitude, longitude)
-            VALUES (%s, %s, %s)
+            SELECT stop_name, latitude::numeric, longitude::numeric FROM stops_raw
             ON CONFLICT (stop_name) DO NOTHING
-        """, rows)
-        cur.execute("SELECT stop_id, stop_name FROM stops")
-        mapping = {name: sid for sid, name in cur.fetchall()}
+        """)
     conn.commit()
-    return len(rows), mapping
-
-def load_line_stops(conn, path, line_map, stop_map):
-    with conn.cursor() as cur, open(path, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        rows = []
-        for r in reader:
-            lid = line_map.get(r["line_name"])
-            sid = stop_map.get(r["stop_name"])
-            if lid and sid:
-                rows.append((lid, sid, int(r["sequence"]), int(r["time_offset"])))
-        execute_batch(cur, """
+    return n
+
+def load_line_stops(conn, path):
+    with conn.cursor() as cur, open(path, "rb") as f:
+        stage_csv(cur, "line_stops_raw", read_header(f), CopyReader(f))
+        # DO UPDATE cannot touch the same key twice in one statement, so keep the
+        # last staged row per key (ctid follows COPY order) like the row-by-row upsert did
+        cur.execute("""
             INSERT INTO line_stops (line_id, stop_id, sequence_number, time_offset_minutes)
-            VALUES (%s, %s, %s, %s)
+            SELECT DISTINCT ON (l.line_id, s.stop_id)
+                   l.line_id, s.stop_id, r.sequence::int, r.time_offset::int
+            FROM line_stops_raw r
+            JOIN lines l ON l.line_name = r.line_name
+            JOIN stops s ON s.stop_name = r.stop_name
+            ORDER BY l.line_id, s.stop_id, r.ctid DESC
             ON CONFLICT (line_id, stop_id) DO UPDATE
             SET sequence_number = EXCLUDED.sequence_number,
                 time_offset_minutes = EXCLUDED.time_offset_minutes
-        """, rows)
+        """)
+        n = cur.rowcount
     conn.commit()
-    return len(rows)
-
-def load_trips(conn, path, line_map):
-    with conn.cursor() as cur, open(path, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        rows = []
-        for r in reader:
-            lid = line_map.get(r["line_name"])
-            if lid:
-                rows.append((r["trip_id"], lid, r["scheduled_departure"], r["vehicle_id"]))
-        execute_batch(cur, """
+    return n
+
+def load_trips(conn, path):
+    with conn.cursor() as cur, open(path, "rb") as f:
+        stage_csv(cur, "trips_raw", read_header(f), CopyReader(f))
+        cur.execute("""
             INSERT INTO trips (trip_code, line_id, scheduled_departure, vehicle_id)
-            VALUES (%s, %s, %s, %s)
+            SELECT r.trip_id, l.line_id, r.scheduled_departure::timestamp, r.vehicle_id
+            FROM trips_raw r
+            JOIN lines l ON l.line_name = r.line_name
             ON CONFLICT (trip_code) DO NOTHING
-        """, rows)
+        """)
+        n = cur.rowcount
     conn.commit()
-    return len(rows)
-
-def load_stop_events(conn, path, stop_map):
-    with conn.cursor() as cur, open(path, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        rows = []
-        for r in reader:
-            sid = stop_map.get(r["stop_name"])
-            if sid:
-                rows.append((r["trip_id"], sid, r["scheduled"], r["actual"], int(r["passengers_on"]), int(r["passengers_off"])))
-        execute_batch(cur, """
-            INSERT INTO stop_events (trip_code, stop_id, scheduled_time, actual_time, passengers_on, passengers_off)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, rows)
-    conn.commit()
-    return len(rows)
+    return n
+
+def split_ranges(path, parts):
+    # byte ranges over the data rows, each starting and ending on a line boundary
+    with open(path, "rb") as f:
+        f.readline()
+        start = f.tell()
+        size = os.fstat(f.fileno()).st_size
+        bounds = [start]
+        for i in range(1, parts):
+            f.seek(max(start + (size - start) * i // parts, bounds[-1]))
+            f.readline()
+            bounds.append(min(f.tell(), size))
+        bounds.append(size)
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if a < b]
+
+def load_stop_events_range(args, path, header, start, end):
+    conn = connect(args)
+    try:
+        tune_session(conn)
+        with conn.cursor() as cur, open(path, "rb") as f:
+            f.seek(start)
+            stage_csv(cur, "stop_events_raw", header, CopyReader(f, end))
+            cur.execute("""
+                INSERT INTO stop_events (trip_code, stop_id, scheduled_time, actual_time, passengers_on, passengers_off)
+                SELECT r.trip_id, s.stop_id, r.scheduled::timestamp, r.actual::timestamp,
+                       r.passengers_on::int, r.passengers_off::int
+                FROM stop_events_raw r
+                JOIN stops s ON s.stop_name = r.stop_name
+            """)
+            n = cur.rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    return n
+
+def load_stop_events(args, path, workers):
+    # each worker COPYs its own slice of the file over a separate connection
+    with open(path, "rb") as f:
+        header = read_header(f)
+    ranges = split_ranges(path, workers)
+    if not ranges:
+        return 0
+    with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+        futures = [pool.submit(load_stop_events_range, args, path, header, start, end)
+                   for start, end in ranges]
+        return sum(f.result() for f in futures)
 
 def resolve_data_dir(base_dir):
     candidates = [base_dir, "./data", "data", "./datasets", "datasets", "./metro_data", "metro_data"]
@@ -116,15 +226,21 @@ def parse_args():
     ap.add_argument("--password", default="transit123")
     ap.add_argument("--schema", default="schema.sql")
     ap.add_argument("--datadir", default="/app/data")
-    return ap.parse_args()
+    # one connection per worker; keep the default well under the server's max_connections
+    ap.add_argument("--workers", type=int, default=min(os.cpu_count() or 1, 8))
+    args = ap.parse_args()
+    args.workers = max(args.workers, 1)
+    return args
 
 def main():
     args = parse_args()
     args.datadir = resolve_data_dir(args.datadir)
     conn = connect(args)
+    tune_session(conn)
     print(f"Connected to {args.dbname}@{args.host}")
     print("Creating schema...")
     run_schema(conn, args.schema)
+    drop_indexes(conn, args.schema)
     print("Tables created: lines, stops, line_stops, trips, stop_events")
     try:
         lines_csv = os.path.join(args.datadir, "lines.csv")
@@ -132,11 +248,13 @@ def main():
         line_stops_csv = os.path.join(args.datadir, "line_stops.csv")
         trips_csv = os.path.join(args.datadir, "trips.csv")
         stop_events_csv = os.path.join(args.datadir, "stop_events.csv")
-        c1, line_map = load_lines(conn, lines_csv)
-        c2, stop_map = load_stops(conn, stops_csv)
-        c3 = load_line_stops(conn, line_stops_csv, line_map, stop_map)
-        c4 = load_trips(conn, trips_csv, line_map)
-        c5 = load_stop_events(conn, stop_events_csv, stop_map)
+        c1 = load_lines(conn, lines_csv)
+        c2 = load_stops(conn, stops_csv)
+        c3 = load_line_stops(conn, line_stops_csv)
+        c4 = load_trips(conn, trips_csv)
+        c5 = load_stop_events(args, stop_events_csv, args.workers)
+        print("Creating indexes...")
+        create_indexes(conn, args.schema)
         total = c1 + c2 + c3 + c4 + c5
         print(f"\nTotal: {total} rows loaded")
         conn.commit()
@@ -1,26 +1,176 @@
 #!/usr/bin/env python3
-import os, sys, json, argparse, urllib.parse
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import os, sys, re, json, time, random, argparse, urllib.parse, functools, heapq
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 import boto3
-from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.config import Config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 AUTHOR_INDEX = "AuthorIndex"
 PAPER_INDEX  = "PaperIdIndex"
 KEYWORD_INDEX= "KeywordIndex"
+AUTHOR_SHARDS = 8        # GSI1PK is AUTHOR#{name}#{crc32(arxiv_id) % AUTHOR_SHARDS}, see load_data.py
+
+BATCH_GET_SIZE = 100     # BatchGetItem limit
+MAX_UNPROCESSED_RETRIES = 10
+SK_MAX = "#\uffff"       # sorts after any "<date>#<arxiv_id>" sort key for that date
+BOTO_CONFIG = Config(max_pool_connections=50, tcp_keepalive=True)
 
-def ddb_table(table_name, region):
+_deserializer = TypeDeserializer()
+_shard_pool = ThreadPoolExecutor(max_workers=32)
+
+@functools.lru_cache(maxsize=None)
+def ddb_client(region):
+    # low-level clients are thread-safe, so every request thread shares this one and its
+    # pool of kept-alive connections
     session = boto3.Session(region_name=region)
-    return session.resource("dynamodb").Table(table_name)
+    return session.client("dynamodb", config=BOTO_CONFIG)
+
+def plain(item):
+    return {k: _deserializer.deserialize(v) for k, v in item.items()}
 
 def json_response(handler, code, payload):
-    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    if orjson:
+        body = orjson.dumps(payload)
+    else:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
     handler.send_response(code)
     handler.send_header("Content-Type", "application/json; charset=utf-8")
     handler.send_header("Content-Length", str(len(body)))
     handler.end_headers()
     handler.wfile.write(body)
 
+def list_ids(client, table_name, condition, names, values, **kwargs):
+    # listings only read arxiv_id; hydrate() fetches the papers themselves
+    resp = client.query(
+        TableName=table_name,
+        KeyConditionExpression=condition,
+        ProjectionExpression="#id",
+        ExpressionAttributeNames={"#id": "arxiv_id", **names},
+        ExpressionAttributeValues=values,
+        **kwargs
+    )
+    return [i["arxiv_id"]["S"] for i in resp.get("Items", [])]
+
+def list_author_ids(client, table_name, author_name, limit):
+    # each shard is already in GSI1SK order, so a k-way merge gives the overall order
+    def shard(n):
+        resp = client.query(
+            TableName=table_name,
+            IndexName=AUTHOR_INDEX,
+            KeyConditionExpression="#pk = :pk",
+            ProjectionExpression="#id, #sk",
+            ExpressionAttributeNames={"#id": "arxiv_id", "#pk": "GSI1PK", "#sk": "GSI1SK"},
+            ExpressionAttributeValues={":pk": {"S": f"AUTHOR#{author_name}#{n}"}},
+            Limit=limit
+        )
+        return [(i["GSI1SK"]["S"], i["arxiv_id"]["S"]) for i in resp.get("Items", [])]
+    merged = heapq.merge(*_shard_pool.map(shard, range(AUTHOR_SHARDS)))
+    return [arxiv_id for _, arxiv_id in islice(merged, limit)]
+
+def hydrate(client, table_name, ids):
+    ids = list(dict.fromkeys(ids))
+    papers = {}
+    for n in range(0, len(ids), BATCH_GET_SIZE):
+        request = {table_name: {"Keys": [
+            {"PK": {"S": f"PAPER#{arxiv_id}"}, "SK": {"S": "A"}} for arxiv_id in ids[n:n + BATCH_GET_SIZE]
+        ]}}
+        for attempt in range(MAX_UNPROCESSED_RETRIES):
+            resp = client.batch_get_item(RequestItems=request)
+            for raw in resp["Responses"].get(table_name, []):
+                papers[raw["arxiv_id"]["S"]] = plain(raw)
+            request = resp.get("UnprocessedKeys")
+            if not request:
+                break
+            time.sleep(random.uniform(0, min(0.05 * 2 ** attempt, 5.0)))
+        else:
+            # a partial page would look like a complete one, so fail the request instead
+            raise RuntimeError(f"{len(request[table_name]['Keys'])} keys still unprocessed after {MAX_UNPROCESSED_RETRIES} retries")
+    return [papers[arxiv_id] for arxiv_id in ids if arxiv_id in papers]
+
+# /papers/recent?category=...&limit=...
+def handle_recent(client, table_name, qs):
+    category = qs.get("category", [None])[0]
+    limit = int(qs.get("limit", ["20"])[0])
+    if not category:
+        return 400, {"error":"missing category"}
+    ids = list_ids(
+        client, table_name, "#pk = :pk", {"#pk": "PK"}, {":pk": {"S": f"CATEGORY#{category}"}},
+        ScanIndexForward=False,
+        Limit=limit
+    )
+    items = hydrate(client, table_name, ids)
+    return 200, {"category": category, "papers": items, "count": len(items)}
+
+# /papers/author/{author_name}?limit=...
+def handle_author(client, table_name, qs, author_name):
+    limit = int(qs.get("limit", ["100"])[0])
+    ids = list_author_ids(client, table_name, author_name, limit)
+    items = hydrate(client, table_name, ids)
+    return 200, {"author": author_name, "papers": items, "count": len(items)}
+
+# /papers/{arxiv_id}
+def handle_paper(client, table_name, qs, arxiv_id):
+    resp = client.query(
+        TableName=table_name,
+        IndexName=PAPER_INDEX,
+        KeyConditionExpression="#pk = :pk",
+        ExpressionAttributeNames={"#pk": "GSI2PK"},
+        ExpressionAttributeValues={":pk": {"S": f"PAPER#{arxiv_id}"}}
+    )
+    items = resp.get("Items", [])
+    if not items:
+        return 404, {"error":"not found"}
+    return 200, plain(items[0])
+
+# /papers/search?category=...&start=YYYY-MM-DD&end=YYYY-MM-DD&limit=...
+def handle_search(client, table_name, qs):
+    category = qs.get("category", [None])[0]
+    start = qs.get("start", [None])[0]
+    end = qs.get("end", [None])[0]
+    limit = int(qs.get("limit", ["100"])[0])
+    if not category or not start or not end:
+        return 400, {"error":"missing category/start/end"}
+    ids = list_ids(
+        client, table_name, "#pk = :pk AND #sk BETWEEN :start AND :end", {"#pk": "PK", "#sk": "SK"},
+        {":pk": {"S": f"CATEGORY#{category}"}, ":start": {"S": f"{start}#"}, ":end": {"S": end + SK_MAX}},
+        Limit=limit
+    )
+    items = hydrate(client, table_name, ids)
+    return 200, {"category": category, "start": start, "end": end, "papers": items, "count": len(items)}
+
+# /papers/keyword/{keyword}?limit=...
+def handle_keyword(client, table_name, qs, keyword):
+    keyword = keyword.lower()
+    limit = int(qs.get("limit", ["20"])[0])
+    ids = list_ids(
+        client, table_name, "#pk = :pk", {"#pk": "GSI3PK"}, {":pk": {"S": f"KEYWORD#{keyword}"}},
+        IndexName=KEYWORD_INDEX,
+        ScanIndexForward=False,
+        Limit=limit
+    )
+    items = hydrate(client, table_name, ids)
+    return 200, {"keyword": keyword, "papers": items, "count": len(items)}
+
+# first match wins, so the fixed /papers/... routes must precede /papers/{arxiv_id}
+ROUTES = [
+    (re.compile(r"^/papers/recent$"), handle_recent),
+    (re.compile(r"^/papers/search$"), handle_search),
+    (re.compile(r"^/papers/author/(.+)$"), handle_author),
+    (re.compile(r"^/papers/keyword/(.+)$"), handle_keyword),
+    (re.compile(r"^/papers/([^/]+)$"), handle_paper),
+]
+
 class Api(BaseHTTPRequestHandler):
+    # keep client connections open between requests; json_response always sets Content-Length
+    protocol_version = "HTTP/1.1"
+
     def log_message(self, fmt, *args):
         sys.stdout.write("%s - - [%s] %s\n" % (self.client_address[0], self.log_date_time_string(), fmt%args))
         sys.stdout.flush()
@@ -28,74 +178,16 @@ class Api(BaseHTTPRequestHandler):
     def do_GET(self):
         try:
             parsed = urllib.parse.urlparse(self.path)
-            path = parsed.path
             qs = urllib.parse.parse_qs(parsed.query)
             region = os.environ.get("AWS_REGION","us-east-1")
             table_name = os.environ.get("ARXIV_TABLE","arxiv-papers")
-            table = ddb_table(table_name, region)
-
-            # /papers/recent?category=...&limit=...
-            if path == "/papers/recent":
-                category = qs.get("category", [None])[0]
-                limit = int(qs.get("limit", ["20"])[0])
-                if not category:
-                    return json_response(self, 400, {"error":"missing category"})
-                resp = table.query(
-                    KeyConditionExpression=Key('PK').eq(f'CATEGORY#{category}'),
-                    ScanIndexForward=False,
-                    Limit=limit
-                )
-                items = resp.get("Items", [])
-                return json_response(self, 200, {"category": category, "papers": items, "count": len(items)})
-
-            # /papers/author/{author_name}
-            if path.startswith("/papers/author/"):
-                author_name = urllib.parse.unquote(path.split("/papers/author/")[1])
-                resp = table.query(
-                    IndexName=AUTHOR_INDEX,
-                    KeyConditionExpression=Key('GSI1PK').eq(f'AUTHOR#{author_name}')
-                )
-                items = resp.get("Items", [])
-                return json_response(self, 200, {"author": author_name, "papers": items, "count": len(items)})
-
-            # /papers/{arxiv_id}
-            if path.startswith("/papers/") and path.count("/") == 2 and not path.startswith("/papers/author/") and not path.startswith("/papers/keyword/"):
-                arxiv_id = urllib.parse.unquote(path.split("/papers/")[1])
-                resp = table.query(
-                    IndexName=PAPER_INDEX,
-                    KeyConditionExpression=Key('GSI2PK').eq(f'PAPER#{arxiv_id}')
-                )
-                items = resp.get("Items", [])
-                if not items:
-                    return json_response(self, 404, {"error":"not found"})
-                return json_response(self, 200, items[0])
-
-            # /papers/search?category=...&start=YYYY-MM-DD&end=YYYY-MM-DD
-            if path == "/papers/search":
-                category = qs.get("category", [None])[0]
-                start = qs.get("start", [None])[0]
-                end = qs.get("end", [None])[0]
-                if not category or not start or not end:
-                    return json_response(self, 400, {"error":"missing category/start/end"})
-                resp = table.query(
-                    KeyConditionExpression=Key('PK').eq(f'CATEGORY#{category}') &
-                                           Key('SK').between(f'{start}#', f'{end}#zzzzzzz')
-                )
-                items = resp.get("Items", [])
-                return json_response(self, 200, {"category": category, "start": start, "end": end, "papers": items, "count": len(items)})
-
-            # /papers/keyword/{keyword}?limit=...
-            if path.startswith("/papers/keyword/"):
-                keyword = urllib.parse.unquote(path.split("/papers/keyword/")[1]).lower()
-                limit = int(qs.get("limit", ["20"])[0])
-                resp = table.query(
-                    IndexName=KEYWORD_INDEX,
-                    KeyConditionExpression=Key('GSI3PK').eq(f'KEYWORD#{keyword}'),
-                    ScanIndexForward=False,
-                    Limit=limit
-                )
-                items = resp.get("Items", [])
-                return json_response(self, 200, {"keyword": keyword, "papers": items, "count": len(items)})
+            client = ddb_client(region)
+
+            for pattern, handler in ROUTES:
+                m = pattern.match(parsed.path)
+                if m:
+                    code, payload = handler(client, table_name, qs, *map(urllib.parse.unquote, m.groups()))
+                    return json_response(self, code, payload)
 
             return json_response(self, 404, {"error":"route not found"})
         except Exception as e:
@@ -106,7 +198,9 @@ def main():
     ap.add_argument("port", nargs="?", type=int, default=8080)
     args = ap.parse_args()
     port = args.port
-    httpd = HTTPServer(("0.0.0.0", port), Api)
+    # build the shared client before request threads start using it
+    ddb_client(os.environ.get("AWS_REGION","us-east-1"))
+    httpd = ThreadingHTTPServer(("0.0.0.0", port), Api)
     print(f"Listening on :{port}")
     httpd.serve_forever()
 
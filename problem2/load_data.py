@@ -1,10 +1,18 @@
 #!/usr/bin/env python3
-import sys, os, json, re, argparse
+import sys, os, json, re, time, random, argparse, threading, zlib
 from datetime import datetime
-from collections import Counter, defaultdict
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import boto3
+from boto3.dynamodb.types import TypeSerializer
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 STOPWORDS = {
     'the','a','an','and','or','but','in','on','at','to','for','of','with','by','from','up',
     'about','into','through','during','is','are','was','were','be','been','being','have','has',
@@ -13,23 +21,37 @@ STOPWORDS = {
     'proposed','show'
 }
 
+TOKEN_RE = re.compile(r"[A-Za-z][A-Za-z0-9\-]{2,}")
+
 TABLE_BILLING = "PAY_PER_REQUEST"
 AUTHOR_INDEX = "AuthorIndex"
 PAPER_INDEX  = "PaperIdIndex"
 KEYWORD_INDEX= "KeywordIndex"
+AUTHOR_SHARDS = 8        # author GSI partitions are split by crc32(arxiv_id) to spread hot authors
+
+BOTO_CONFIG = Config(max_pool_connections=32, retries={"mode": "adaptive"})
+BATCH_SIZE = 25          # BatchWriteItem limit
+MAX_UNPROCESSED_RETRIES = 10
+
+_serializer = TypeSerializer()
+_local = threading.local()
 
 def parse_args():
     ap = argparse.ArgumentParser(description="Load ArXiv papers into DynamoDB (denormalized)")
     ap.add_argument("papers_json_path")
     ap.add_argument("table_name")
     ap.add_argument("--region", default=os.environ.get("AWS_REGION","us-east-1"))
+    ap.add_argument("--workers", type=int, default=32)
     return ap.parse_args()
 
 def ensure_table(dynamodb, table_name):
     ddb = dynamodb
-    existing = {t.name for t in ddb.tables.all()}
-    if table_name in existing:
+    try:
+        ddb.meta.client.describe_table(TableName=table_name)
         return ddb.Table(table_name)
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ResourceNotFoundException":
+            raise
 
     print(f"Creating DynamoDB table: {table_name}")
     table = ddb.create_table(
@@ -80,18 +102,15 @@ def ensure_table(dynamodb, table_name):
     table.wait_until_exists()
     return table
 
-def tokenize(text):
-    words = re.findall(r"[A-Za-z][A-Za-z0-9\-]*", text or "")
-    return [w.lower() for w in words]
-
 def extract_keywords(abstract, topk=10):
-    tokens = tokenize(abstract)
-    filtered = [t for t in tokens if t not in STOPWORDS and len(t) >= 3]
-    counts = Counter(filtered)
+    # TOKEN_RE already enforces the 3-character minimum
+    counts = Counter(t for t in map(str.lower, TOKEN_RE.findall(abstract or "")) if t not in STOPWORDS)
     return [w for w,_ in counts.most_common(topk)]
 
 def iso_to_date(iso_str):
-    # expected ISO time e.g. "2023-01-15T10:30:00Z"
+    # expected ISO time e.g. "2023-01-15T10:30:00Z"; the date is the first 10 chars
+    if len(iso_str) >= 10 and iso_str[4] == "-" and iso_str[7] == "-":
+        return iso_str[:10]
     try:
         dt = datetime.fromisoformat(iso_str.replace("Z","+00:00"))
     except ValueError:
@@ -103,96 +122,143 @@ def safe_str(x):
     return "" if x is None else str(x)
 
 def load_papers(path):
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    with open(path, "rb") as f:
+        data = orjson.loads(f.read()) if orjson else json.load(f)
     # Accept either list or dict with "papers"
     if isinstance(data, dict) and "papers" in data:
         data = data["papers"]
     return data
 
+def paper_items(p):
+    # yields (stats key, item) for every denormalized item of one paper
+    arxiv_id = safe_str(p.get("arxiv_id") or p.get("id"))
+    title = safe_str(p.get("title"))
+    authors = p.get("authors") or []
+    abstract = safe_str(p.get("abstract"))
+    categories = p.get("categories") or []
+    published_iso = safe_str(p.get("published") or p.get("updated") or p.get("date"))
+    if not arxiv_id or not title or not published_iso:
+        return
+
+    date_str = iso_to_date(published_iso)
+    keywords = extract_keywords(abstract, topk=10)
+
+    core = {
+        "arxiv_id": arxiv_id,
+        "title": title,
+        "authors": authors,
+        "abstract": abstract,
+        "categories": categories,
+        "keywords": keywords,
+        "published": published_iso,
+    }
+
+    pk_paper = f"PAPER#{arxiv_id}"
+    sk = f"{date_str}#{arxiv_id}"
+
+    # Category/author/keyword items only point at the paper; readers fetch the
+    # full record from the paper item
+    summary = {"arxiv_id": arxiv_id, "title": title, "published": published_iso}
+
+    # Paper ID item (for direct lookup)
+    paper_item = core.copy()
+    paper_item.update(PK=pk_paper, SK="A", GSI2PK=pk_paper, GSI2SK=date_str)
+    yield "paper_id_items", paper_item
+
+    # Category items (one per category)
+    for cat in categories:
+        cat_item = summary.copy()
+        cat_item.update(PK=f"CATEGORY#{cat}", SK=sk)
+        yield "category_items", cat_item
+
+    # Author items (one per author)
+    author_shard = zlib.crc32(arxiv_id.encode("utf-8")) % AUTHOR_SHARDS
+    for author in authors:
+        pk_author = f"AUTHOR#{author}"
+        a_item = summary.copy()
+        a_item.update(
+            PK=pk_author, SK=sk,
+            GSI1PK=f"{pk_author}#{author_shard}", GSI1SK=sk,
+        )
+        yield "author_items", a_item
+
+    # Keyword items (one per keyword)
+    for kw in keywords:
+        pk_kw = f"KEYWORD#{kw}"
+        k_item = summary.copy()
+        k_item.update(
+            PK=pk_kw, SK=sk,
+            GSI3PK=pk_kw, GSI3SK=sk,
+        )
+        yield "keyword_items", k_item
+
+def all_items(papers, stats):
+    for p in papers:
+        n = 0
+        for kind, item in paper_items(p):
+            stats[kind] += 1
+            n += 1
+            yield item
+        if n:
+            stats["papers"] += 1
+
+def batches(items):
+    # BatchWriteItem rejects repeated keys in one request; a later put replaces an earlier one
+    batch = {}
+    for item in items:
+        batch[(item["PK"], item["SK"])] = item
+        if len(batch) == BATCH_SIZE:
+            yield list(batch.values())
+            batch = {}
+    if batch:
+        yield list(batch.values())
+
+def thread_client(region):
+    # sessions are not thread-safe, so every worker thread gets its own session and client
+    if not hasattr(_local, "client"):
+        _local.client = boto3.Session(region_name=region).client("dynamodb", config=BOTO_CONFIG)
+    return _local.client
+
+def write_batch(table_name, region, batch):
+    client = thread_client(region)
+    request = {table_name: [
+        {"PutRequest": {"Item": {k: _serializer.serialize(v) for k, v in item.items()}}}
+        for item in batch
+    ]}
+    for attempt in range(MAX_UNPROCESSED_RETRIES):
+        request = client.batch_write_item(RequestItems=request).get("UnprocessedItems")
+        if not request:
+            return
+        # throttled: exponential backoff with full jitter before resending the leftovers
+        time.sleep(random.uniform(0, min(0.05 * 2 ** attempt, 5.0)))
+    raise RuntimeError(f"{len(request[table_name])} items still unprocessed after {MAX_UNPROCESSED_RETRIES} retries")
+
 def main():
     args = parse_args()
     session = boto3.Session(region_name=args.region)
-    dynamodb = session.resource("dynamodb")
+    dynamodb = session.resource("dynamodb", config=BOTO_CONFIG)
     table = ensure_table(dynamodb, args.table_name)
 
     print(f"Loading papers from {args.papers_json_path}...")
     papers = load_papers(args.papers_json_path)
 
     print("Extracting keywords from abstracts...")
-    total_papers = 0
-    stats = defaultdict(int)
-
-    with table.batch_writer(overwrite_by_pkeys=["PK","SK"]) as bw:
-        for p in papers:
-            arxiv_id = safe_str(p.get("arxiv_id") or p.get("id"))
-            title = safe_str(p.get("title"))
-            authors = p.get("authors") or []
-            abstract = safe_str(p.get("abstract"))
-            categories = p.get("categories") or []
-            published_iso = safe_str(p.get("published") or p.get("updated") or p.get("date"))
-            if not arxiv_id or not title or not published_iso:
-                continue
-
-            date_str = iso_to_date(published_iso)
-            keywords = extract_keywords(abstract, topk=10)
-
-            core = {
-                "arxiv_id": arxiv_id,
-                "title": title,
-                "authors": authors,
-                "abstract": abstract,
-                "categories": categories,
-                "keywords": keywords,
-                "published": published_iso,
-            }
-
-            # Paper ID item (for direct lookup)
-            paper_item = {
-                "PK": f"PAPER#{arxiv_id}",
-                "SK": "A",
-                "GSI2PK": f"PAPER#{arxiv_id}",
-                "GSI2SK": date_str,
-                **core,
-            }
-            bw.put_item(Item=paper_item)
-            stats["paper_id_items"] += 1
-
-            # Category items (one per category)
-            for cat in categories:
-                cat_item = {
-                    "PK": f"CATEGORY#{cat}",
-                    "SK": f"{date_str}#{arxiv_id}",
-                    **core,
-                }
-                bw.put_item(Item=cat_item)
-                stats["category_items"] += 1
-
-            # Author items (one per author)
-            for author in authors:
-                a_item = {
-                    "PK": f"AUTHOR#{author}",
-                    "SK": f"{date_str}#{arxiv_id}",
-                    "GSI1PK": f"AUTHOR#{author}",
-                    "GSI1SK": f"{date_str}#{arxiv_id}",
-                    **core,
-                }
-                bw.put_item(Item=a_item)
-                stats["author_items"] += 1
-
-            # Keyword items (one per keyword)
-            for kw in keywords:
-                k_item = {
-                    "PK": f"KEYWORD#{kw}",
-                    "SK": f"{date_str}#{arxiv_id}",
-                    "GSI3PK": f"KEYWORD#{kw}",
-                    "GSI3SK": f"{date_str}#{arxiv_id}",
-                    **core,
-                }
-                bw.put_item(Item=k_item)
-                stats["keyword_items"] += 1
-
-            total_papers += 1
+    stats = Counter()
+
+    workers = max(1, args.workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # keep a bounded number of batches in flight instead of queueing the whole corpus
+        inflight = set()
+        for batch in batches(all_items(papers, stats)):
+            if len(inflight) >= 2 * workers:
+                done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                for f in done:
+                    f.result()
+            inflight.add(pool.submit(write_batch, table.name, args.region, batch))
+        for f in inflight:
+            f.result()
+
+    total_papers = stats["papers"]
 
     total_items = stats["paper_id_items"] + stats["category_items"] + stats["author_items"] + stats["keyword_items"]
     factor = (total_items / total_papers) if total_papers else 0.0
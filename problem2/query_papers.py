@@ -1,110 +1,527 @@
 #!/usr/bin/env python3
-import sys, os, json, argparse, time
+import sys, os, json, time, random, functools, heapq
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import boto3
-from boto3.dynamodb.conditions import Key
+from itertools import islice
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 AUTHOR_INDEX = "AuthorIndex"
 PAPER_INDEX  = "PaperIdIndex"
 KEYWORD_INDEX= "KeywordIndex"
+AUTHOR_SHARDS = 8        # GSI1PK is AUTHOR#{name}#{crc32(arxiv_id) % AUTHOR_SHARDS}, see load_data.py
+DEFAULT_TABLE = os.environ.get("ARXIV_TABLE", "arxiv-papers")
+DEFAULT_REGION = os.environ.get("AWS_REGION", "us-east-1")
+
+# boto3/botocore are imported on first use so that importing this module stays cheap
+BOTO_CONFIG_ARGS = dict(
+    tcp_keepalive=True,
+    max_pool_connections=50,
+    connect_timeout=1.0,
+    read_timeout=5.0,
+    retries={"max_attempts": 10, "mode": "adaptive"},
+)
+
+_PK_KCE = "#pk = :pk"
+_RANGE_KCE = "#pk = :pk AND #sk BETWEEN :s AND :e"
+_RECENT_EAN = {"#pk": "PK"}
+_AUTHOR_EAN = {"#pk": "GSI1PK"}
+_PAPER_EAN = {"#pk": "GSI2PK"}
+_RANGE_EAN = {"#pk": "PK", "#sk": "SK"}
+_KEYWORD_EAN = {"#pk": "GSI3PK"}
+LEAN_FIELDS = ("arxiv_id", "title", "published")
+SUMMARY_FIELDS = frozenset(LEAN_FIELDS)  # what load_data copies onto category/author/keyword items
+SK_MAX = "#\uffff"  # sorts after any "<date>#<arxiv_id>" sort key for that date
+BATCH_GET_SIZE = 100
+MAX_UNPROCESSED_RETRIES = 10
+
+class OrjsonShim:
+    """Drop-in for the `json` name inside botocore's parser/serializer modules, backed by orjson."""
+
+    JSONDecodeError = json.JSONDecodeError
+
+    @staticmethod
+    def loads(s, **kwargs):
+        return json.loads(s, **kwargs) if kwargs else orjson.loads(s)
+
+    @staticmethod
+    def dumps(obj, separators=None, **kwargs):
+        if kwargs:
+            return json.dumps(obj, separators=separators, **kwargs)
+        return orjson.dumps(obj).decode("utf-8")
+
+def patch_botocore_json():
+    # rebinds only botocore's module-level `json`; the real json module is left alone
+    if orjson is None:
+        return
+    import botocore.parsers, botocore.serialize
+    botocore.parsers.json = botocore.serialize.json = OrjsonShim
+
+class TTLCache:
+    """LRU cache whose entries expire `ttl` seconds after insertion; ttl <= 0 disables it."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize, self.ttl, self.data = maxsize, ttl, OrderedDict()
 
-def dynamo(table_name, region):
+    def get(self, key):
+        if self.ttl <= 0 or key not in self.data:
+            return None
+        expires, value = self.data[key]
+        if expires < time.monotonic():
+            del self.data[key]
+            return None
+        self.data.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if self.ttl <= 0:
+            return
+        self.data[key] = (time.monotonic() + self.ttl, value)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+_CACHE = TTLCache(maxsize=1024, ttl=0)
+
+def set_cache_ttl(seconds):
+    _CACHE.ttl = seconds
+    if seconds <= 0:
+        _CACHE.data.clear()
+
+@functools.lru_cache(maxsize=None)
+def boto_config():
+    from botocore.config import Config
+    patch_botocore_json()
+    return Config(**BOTO_CONFIG_ARGS)
+
+@functools.lru_cache(maxsize=8)
+def dynamo(region):
+    import boto3
     session = boto3.Session(region_name=region)
-    return session.resource("dynamodb").Table(table_name)
+    return session.client("dynamodb", config=boto_config())
+
+def number(s):
+    try:
+        return int(s)
+    except ValueError:
+        return float(s)
+
+def value(attr):
+    (kind, v), = attr.items()
+    if kind == "N":
+        return number(v)
+    if kind == "NS":
+        return [number(n) for n in v]
+    if kind == "L":
+        return [value(a) for a in v]
+    if kind == "M":
+        return plain(v)
+    if kind == "NULL":
+        return None
+    if kind in ("SS", "BS"):
+        return list(v)
+    return v
+
+def plain(item):
+    return {k: value(v) for k, v in item.items()}
+
+def json_default(o):
+    if isinstance(o, Decimal):
+        return int(o) if o == o.to_integral_value() else float(o)
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+def dumps(obj):
+    if orjson:
+        return orjson.dumps(obj, default=json_default, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, default=json_default, ensure_ascii=False, indent=2).encode("utf-8")
+
+def write_all(payload):
+    try:
+        fd = sys.stdout.fileno()
+    except (AttributeError, OSError, ValueError):
+        sys.stdout.write(payload.decode("utf-8"))
+        return
+    sys.stdout.flush()
+    view = memoryview(payload)
+    while view:
+        view = view[os.write(fd, view):]
 
 def out(obj):
-    print(json.dumps(obj, ensure_ascii=False, indent=2))
-
-def query_recent_in_category(table_name, category, limit, region):
-    t0 = time.time()
-    table = dynamo(table_name, region)
-    resp = table.query(
-        KeyConditionExpression=Key('PK').eq(f'CATEGORY#{category}'),
-        ScanIndexForward=False,
-        Limit=limit
-    )
-    items = resp.get("Items", [])
-    return {
-        "query_type": "recent_in_category",
-        "parameters": {"category": category, "limit": limit},
-        "results": items,
-        "count": len(items),
-        "execution_time_ms": int((time.time()-t0)*1000)
-    }
+    write_all(dumps(obj) + b"\n")
 
-def query_papers_by_author(table_name, author_name, region):
-    t0 = time.time()
-    table = dynamo(table_name, region)
-    resp = table.query(
-        IndexName=AUTHOR_INDEX,
-        KeyConditionExpression=Key('GSI1PK').eq(f'AUTHOR#{author_name}')
-    )
-    items = resp.get("Items", [])
-    return {
-        "query_type": "papers_by_author",
-        "parameters": {"author_name": author_name},
-        "results": items,
-        "count": len(items),
-        "execution_time_ms": int((time.time()-t0)*1000)
-    }
+def out_stream(query_type, parameters, items, t0):
+    # same bytes as out(result(...)), but items are written as the paginator yields them
+    buf = bytearray(b'{\n  "query_type": ' + dumps(query_type)
+                    + b',\n  "parameters": ' + dumps(parameters).replace(b"\n", b"\n  ")
+                    + b',\n  "results": [')
+    count = 0
+    for item in items:
+        buf += b",\n    " if count else b"\n    "
+        buf += dumps(plain(item)).replace(b"\n", b"\n    ")
+        count += 1
+        if len(buf) >= 65536:
+            write_all(bytes(buf))
+            buf.clear()
+    ms = (time.perf_counter_ns()-t0) // 1_000_000
+    buf += b"\n  ]" if count else b"]"
+    buf += b',\n  "count": %d,\n  "execution_time_ms": %d\n}\n' % (count, ms)
+    write_all(bytes(buf))
 
-def get_paper_by_id(table_name, arxiv_id, region):
-    t0 = time.time()
-    table = dynamo(table_name, region)
-    resp = table.query(
-        IndexName=PAPER_INDEX,
-        KeyConditionExpression=Key('GSI2PK').eq(f'PAPER#{arxiv_id}')
-    )
-    items = resp.get("Items", [])
-    item = items[0] if items else None
-    return {
-        "query_type": "get_paper_by_id",
-        "parameters": {"arxiv_id": arxiv_id},
-        "results": [item] if item else [],
-        "count": 1 if item else 0,
-        "execution_time_ms": int((time.time()-t0)*1000)
-    }
+def parse_fields(value):
+    if isinstance(value, str):
+        if value in ("all", "*"):
+            return None
+        value = value.split(",")
+    return tuple(f.strip() for f in value if f.strip()) or None
+
+def project(request, fields):
+    if not fields:
+        return request
+    names = {f"#f{i}": f for i, f in enumerate(fields)}
+    return dict(request,
+        ProjectionExpression=",".join(names),
+        ExpressionAttributeNames={**request.get("ExpressionAttributeNames", {}), **names})
 
-def query_papers_in_date_range(table_name, category, start_date, end_date, region):
-    t0 = time.time()
-    table = dynamo(table_name, region)
-    resp = table.query(
-        KeyConditionExpression=Key('PK').eq(f'CATEGORY#{category}') &
-                               Key('SK').between(f'{start_date}#', f'{end_date}#zzzzzzz')
+_QUERY_SPEC = {
+    "recent": dict(
+        query_type="recent_in_category", index=None, kce=_PK_KCE, names=_RECENT_EAN,
+        values=lambda p: {":pk": {"S": f"CATEGORY#{p['category']}"}},
+        forward=False, params=("category", "limit"), limit="limit", cache=True, hydrate=True),
+    "author": dict(
+        query_type="papers_by_author", index=AUTHOR_INDEX, kce=_PK_KCE, names=_AUTHOR_EAN,
+        values=lambda p: {":pk": {"S": f"AUTHOR#{p['author_name']}"}},
+        forward=True, params=("author_name",), limit="max", cache=False, hydrate=True,
+        shards=AUTHOR_SHARDS, sort="GSI1SK"),
+    "get": dict(
+        query_type="get_paper_by_id", index=PAPER_INDEX, kce=_PK_KCE, names=_PAPER_EAN,
+        values=lambda p: {":pk": {"S": f"PAPER#{p['arxiv_id']}"}},
+        forward=True, params=("arxiv_id",), limit=None, cache=True),
+    "daterange": dict(
+        query_type="papers_in_date_range", index=None, kce=_RANGE_KCE, names=_RANGE_EAN,
+        values=lambda p: {
+            ":pk": {"S": f"CATEGORY#{p['category']}"},
+            ":s": {"S": f"{p['start_date']}#"},
+            ":e": {"S": p['end_date'] + SK_MAX},
+        },
+        forward=True, params=("category", "start_date", "end_date"), limit="max", cache=False, hydrate=True),
+    "keyword": dict(
+        query_type="papers_by_keyword", index=KEYWORD_INDEX, kce=_PK_KCE, names=_KEYWORD_EAN,
+        values=lambda p: {":pk": {"S": f"KEYWORD#{p['keyword'].lower()}"}},
+        forward=False, params=("keyword", "limit"), limit="limit", cache=False, hydrate=True),
+}
+
+def build_request(spec, table, params):
+    request = dict(
+        TableName=table,
+        KeyConditionExpression=spec["kce"],
+        ExpressionAttributeNames=spec["names"],
+        ExpressionAttributeValues=spec["values"](params),
+        ScanIndexForward=spec["forward"]
     )
-    items = resp.get("Items", [])
+    if spec["index"]:
+        request["IndexName"] = spec["index"]
+    return request
+
+def sharded_request(spec, table, fields, params):
+    # one request per shard; the sort attribute is projected for the merge and dropped again
+    sort = spec["sort"]
+    strip = bool(fields) and sort not in fields
+    base = project(build_request(spec, table, params), (*fields, sort) if strip else fields)
+    values = base["ExpressionAttributeValues"]
+    pk = values[":pk"]["S"]
+    shards = [dict(base, ExpressionAttributeValues={**values, ":pk": {"S": f"{pk}#{n}"}}) for n in range(spec["shards"])]
+    return {"shards": shards, "sort": sort, "strip": strip, "reverse": not spec["forward"]}
+
+def listing_request(spec, table, fields, params):
+    if spec.get("shards"):
+        return sharded_request(spec, table, fields, params)
+    return project(build_request(spec, table, params), fields)
+
+def prepare(kind, table, fields, params, hydrate=True):
+    # category/author/keyword items only hold the summary attributes; for full records
+    # read just their arxiv_ids and fetch the paper items (see fetch/hydrate_items)
+    spec = _QUERY_SPEC[kind]
+    parameters = {k: params[k] for k in spec["params"]}
+    if hydrate and spec.get("hydrate") and (fields is None or not SUMMARY_FIELDS.issuperset(fields)):
+        request = {"listing": listing_request(spec, table, ("arxiv_id",), params), "table": table, "fields": fields}
+    else:
+        request = listing_request(spec, table, fields, params)
+    limit = params.get(spec["limit"]) if spec["limit"] else 1
+    return spec["query_type"], parameters, request, limit
+
+def page_config(limit):
+    return {"PageSize": limit or 100, "MaxItems": limit}
+
+def load_aioboto3():
+    try:
+        import aioboto3
+    except ImportError:
+        return None
+    return aioboto3
+
+def merge_shards(request, results, limit):
+    sort = request["sort"]
+    merged = heapq.merge(*results, key=lambda i: i[sort]["S"], reverse=request["reverse"])
+    for item in islice(merged, limit):
+        if request["strip"]:
+            item = {k: v for k, v in item.items() if k != sort}
+        yield item
+
+def fetch_shards(client, request, limit):
+    # the cached client is thread-safe, so the shard queries share it and its connection pool;
+    # the asyncio fan-out lives in fetch_async, where multi already has an open aioboto3 client
+    with ThreadPoolExecutor(max_workers=len(request["shards"])) as pool:
+        results = list(pool.map(lambda r: list(fetch(client, r, limit)), request["shards"]))
+    yield from merge_shards(request, results, limit)
+
+def batch_get_request(table_name, ids, fields):
+    keys = [{"PK": {"S": f"PAPER#{arxiv_id}"}, "SK": {"S": "A"}} for arxiv_id in ids]
+    return {table_name: project({"Keys": keys}, fields)}
+
+def batch_get_step(table_name, resp, found, attempt):
+    # keeps one BatchGetItem response; returns what is left to ask for and the backoff before asking
+    found.extend(resp["Responses"].get(table_name, []))
+    request = resp.get("UnprocessedKeys")
+    if request and attempt + 1 >= MAX_UNPROCESSED_RETRIES:
+        raise RuntimeError(f"{len(request[table_name]['Keys'])} keys still unprocessed after {MAX_UNPROCESSED_RETRIES} retries")
+    return request, random.uniform(0, min(0.05 * 2 ** attempt, 5.0))
+
+def get_chunk(client, table_name, ids, fields):
+    request, found = batch_get_request(table_name, ids, fields), []
+    for attempt in range(MAX_UNPROCESSED_RETRIES):
+        request, delay = batch_get_step(table_name, client.batch_get_item(RequestItems=request), found, attempt)
+        if not request:
+            return found
+        time.sleep(delay)
+
+async def get_chunk_async(client, table_name, ids, fields):
+    import asyncio
+    request, found = batch_get_request(table_name, ids, fields), []
+    for attempt in range(MAX_UNPROCESSED_RETRIES):
+        request, delay = batch_get_step(table_name, await client.batch_get_item(RequestItems=request), found, attempt)
+        if not request:
+            return found
+        await asyncio.sleep(delay)
+
+def hydrate_fields(fields):
+    # arxiv_id is needed to put the batch results back in listing order
+    strip = bool(fields) and "arxiv_id" not in fields
+    return ((*fields, "arxiv_id") if strip else fields), strip
+
+def in_order(ids, raws, strip):
+    found = {raw["arxiv_id"]["S"]: raw for raw in raws}
+    for arxiv_id in ids:
+        raw = found.get(arxiv_id)
+        if raw is not None:
+            yield {k: v for k, v in raw.items() if k != "arxiv_id"} if strip else raw
+
+def hydrate_items(client, request, items):
+    fields, strip = hydrate_fields(request["fields"])
+    items = iter(items)
+    while True:
+        ids = [i["arxiv_id"]["S"] for i in islice(items, BATCH_GET_SIZE)]
+        if not ids:
+            return
+        yield from in_order(ids, get_chunk(client, request["table"], list(dict.fromkeys(ids)), fields), strip)
+
+async def hydrate_items_async(client, request, items):
+    import asyncio
+    fields, strip = hydrate_fields(request["fields"])
+    ids = [i["arxiv_id"]["S"] for i in items]
+    unique = list(dict.fromkeys(ids))
+    chunks = await asyncio.gather(*[get_chunk_async(client, request["table"], unique[n:n + BATCH_GET_SIZE], fields)
+                                    for n in range(0, len(unique), BATCH_GET_SIZE)])
+    return list(in_order(ids, [raw for chunk in chunks for raw in chunk], strip))
+
+def fetch(client, request, limit=None):
+    if "listing" in request:
+        yield from hydrate_items(client, request, fetch(client, request["listing"], limit))
+        return
+    if "shards" in request:
+        yield from fetch_shards(client, request, limit)
+        return
+    for page in client.get_paginator("query").paginate(**request, PaginationConfig=page_config(limit)):
+        yield from page["Items"]
+
+def cache_fill(key, items):
+    got = []
+    for item in items:
+        got.append(item)
+        yield item
+    _CACHE.put(key, got)
+
+async def fetch_async(client, request, limit=None):
+    if "listing" in request:
+        return await hydrate_items_async(client, request, await fetch_async(client, request["listing"], limit))
+    if "shards" in request:
+        import asyncio
+        results = await asyncio.gather(*[fetch_async(client, r, limit) for r in request["shards"]])
+        return list(merge_shards(request, results, limit))
+    items = []
+    async for page in client.get_paginator("query").paginate(**request, PaginationConfig=page_config(limit)):
+        items.extend(page["Items"])
+    return items
+
+def count_matches(client, request):
+    if "shards" in request:
+        with ThreadPoolExecutor(max_workers=len(request["shards"])) as pool:
+            return sum(pool.map(lambda r: count_matches(client, r), request["shards"]))
+    pages = client.get_paginator("query").paginate(**request, Select="COUNT")
+    return sum(page["Count"] for page in pages)
+
+def counted(query_type, parameters, count, t0):
     return {
-        "query_type": "papers_in_date_range",
-        "parameters": {"category": category, "start_date": start_date, "end_date": end_date},
-        "results": items,
-        "count": len(items),
-        "execution_time_ms": int((time.time()-t0)*1000)
+        "query_type": query_type,
+        "parameters": parameters,
+        "count": count,
+        "execution_time_ms": (time.perf_counter_ns()-t0) // 1_000_000
     }
 
-def query_papers_by_keyword(table_name, keyword, limit, region):
-    t0 = time.time()
-    table = dynamo(table_name, region)
-    resp = table.query(
-        IndexName=KEYWORD_INDEX,
-        KeyConditionExpression=Key('GSI3PK').eq(f'KEYWORD#{keyword.lower()}'),
-        ScanIndexForward=False,
-        Limit=limit
-    )
-    items = resp.get("Items", [])
+def result(query_type, parameters, items, t0):
+    items = [plain(i) for i in items]
     return {
-        "query_type": "papers_by_keyword",
-        "parameters": {"keyword": keyword, "limit": limit},
+        "query_type": query_type,
+        "parameters": parameters,
         "results": items,
         "count": len(items),
-        "execution_time_ms": int((time.time()-t0)*1000)
+        "execution_time_ms": (time.perf_counter_ns()-t0) // 1_000_000
     }
 
+def cache_key(kind, table, region, fields, parameters):
+    if _QUERY_SPEC[kind]["cache"] and _CACHE.ttl > 0:
+        return (kind, table, region, fields, *parameters.values())
+    return None
+
+def _iter_query(kind, table, region, fields=LEAN_FIELDS, **params):
+    query_type, parameters, request, limit = prepare(kind, table, fields, params)
+    key = cache_key(kind, table, region, fields, parameters)
+    if key is not None:
+        items = _CACHE.get(key)
+        if items is None:
+            items = cache_fill(key, fetch(dynamo(region), request, limit))
+        return query_type, parameters, items
+    return query_type, parameters, fetch(dynamo(region), request, limit)
+
+def _run_query(kind, table, region, fields=LEAN_FIELDS, count_only=False, **params):
+    t0 = time.perf_counter_ns()
+    if count_only:
+        query_type, parameters, request, _ = prepare(kind, table, None, params, hydrate=False)
+        parameters.pop(_QUERY_SPEC[kind]["limit"], None)
+        return counted(query_type, parameters, count_matches(dynamo(region), request), t0)
+    return result(*_iter_query(kind, table, region, fields, **params), t0)
+
+def query_recent_in_category(table_name, category, limit, region, fields=LEAN_FIELDS):
+    return _run_query("recent", table_name, region, fields, category=category, limit=limit)
+
+def query_papers_by_author(table_name, author_name, region, max_items=None, fields=LEAN_FIELDS, count_only=False):
+    return _run_query("author", table_name, region, fields, count_only, author_name=author_name, max=max_items)
+
+def get_paper_by_id(table_name, arxiv_id, region, fields=None):
+    return _run_query("get", table_name, region, fields, arxiv_id=arxiv_id)
+
+def query_papers_in_date_range(table_name, category, start_date, end_date, region, max_items=None, fields=LEAN_FIELDS, count_only=False):
+    return _run_query("daterange", table_name, region, fields, count_only,
+                      category=category, start_date=start_date, end_date=end_date, max=max_items)
+
+def query_papers_by_keyword(table_name, keyword, limit, region, fields=LEAN_FIELDS, count_only=False):
+    return _run_query("keyword", table_name, region, fields, count_only, keyword=keyword, limit=limit)
+
+def get_papers_by_ids(table_name, arxiv_ids, region, fields=None):
+    t0 = time.perf_counter_ns()
+    ids = list(dict.fromkeys(arxiv_ids))
+    if fields and "arxiv_id" not in fields:
+        fields = ("arxiv_id", *fields)
+    client = dynamo(region)
+    chunks = [ids[n:n + BATCH_GET_SIZE] for n in range(0, len(ids), BATCH_GET_SIZE)]
+    found = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(len(chunks), BOTO_CONFIG_ARGS["max_pool_connections"]))) as pool:
+        for chunk in pool.map(lambda c: get_chunk(client, table_name, c, fields), chunks):
+            for raw in chunk:
+                found[raw["arxiv_id"]["S"]] = raw
+    items = [found[arxiv_id] for arxiv_id in ids if arxiv_id in found]
+    return result("get_papers_by_ids", {"arxiv_ids": ids}, items, t0)
+
+def multi_specs(table_name, queries):
+    specs = []
+    for q in queries:
+        params = dict(q)
+        kind = params.pop("cmd", None)
+        if kind not in _QUERY_SPEC:
+            raise SystemExit(f"unknown query cmd: {kind!r} (expected one of {', '.join(_QUERY_SPEC)})")
+        fields = parse_fields(params.pop("fields", "all" if kind == "get" else LEAN_FIELDS))
+        if _QUERY_SPEC[kind]["limit"] == "limit":
+            params.setdefault("limit", 20)
+        try:
+            specs.append((kind, fields, prepare(kind, table_name, fields, params)))
+        except KeyError as e:
+            raise SystemExit(f"{kind} query is missing {e}")
+    return specs
+
+async def run_multi_async(aioboto3, region, specs):
+    import asyncio
+    session = aioboto3.Session(region_name=region)
+    async with session.client("dynamodb", config=boto_config()) as client:
+        async def one(query_type, params, request, limit):
+            t0 = time.perf_counter_ns()
+            items = await fetch_async(client, request, limit)
+            return items, result(query_type, params, items, t0)
+        return await asyncio.gather(*[one(*s) for s in specs])
+
+def run_multi(table_name, queries, region):
+    specs = multi_specs(table_name, queries)
+    if not specs:
+        return []
+    # get/recent entries share _iter_query's cache: hits skip DynamoDB and repeats in one batch run once
+    keys = [cache_key(kind, table_name, region, fields, prepared[1]) for kind, fields, prepared in specs]
+    hits = {key: _CACHE.get(key) for key in keys if key is not None}
+    todo, slot = [], {}
+    for n, (key, (_, _, prepared)) in enumerate(zip(keys, specs)):
+        if key is None or (hits[key] is None and key not in slot):
+            slot[n if key is None else key] = len(todo)
+            todo.append(prepared)
+    aioboto3 = load_aioboto3()
+    if not todo:
+        done = []
+    elif aioboto3 is not None:
+        import asyncio
+        done = asyncio.run(run_multi_async(aioboto3, region, todo))
+    else:
+        client = dynamo(region)
+        def one(spec):
+            query_type, params, request, limit = spec
+            t0 = time.perf_counter_ns()
+            items = list(fetch(client, request, limit))
+            return items, result(query_type, params, items, t0)
+        with ThreadPoolExecutor(max_workers=min(len(todo), BOTO_CONFIG_ARGS["max_pool_connections"])) as pool:
+            done = list(pool.map(one, todo))
+    results = []
+    for n, (key, (_, _, prepared)) in enumerate(zip(keys, specs)):
+        if key is not None and hits[key] is not None:
+            t0 = time.perf_counter_ns()
+            results.append(result(prepared[0], prepared[1], hits[key], t0))
+            continue
+        items, res = done[slot[n if key is None else key]]
+        if key is not None:
+            _CACHE.put(key, items)
+        results.append(dict(res))
+    return results
+
 def parse_args():
+    import argparse
     ap = argparse.ArgumentParser(description="Query ArXiv papers in DynamoDB")
     sub = ap.add_subparsers(dest="cmd", required=True)
 
-    ap.add_argument("--table", default=os.environ.get("ARXIV_TABLE","arxiv-papers"))
-    ap.add_argument("--region", default=os.environ.get("AWS_REGION","us-east-1"))
+    ap.add_argument("--table", default=DEFAULT_TABLE)
+    ap.add_argument("--region", default=DEFAULT_REGION)
+    ap.add_argument("--cache-ttl", type=float, default=0, help="seconds to keep get/recent results in memory (0 = off)")
+    ap.add_argument("--no-cache", action="store_true")
 
     p1 = sub.add_parser("recent")
     p1.add_argument("category")
@@ -112,6 +529,7 @@ def parse_args():
 
     p2 = sub.add_parser("author")
     p2.add_argument("author_name")
+    p2.add_argument("--max", type=int, default=None, help="stop after this many papers")
 
     p3 = sub.add_parser("get")
     p3.add_argument("arxiv_id")
@@ -120,25 +538,54 @@ def parse_args():
     p4.add_argument("category")
     p4.add_argument("start_date")
     p4.add_argument("end_date")
+    p4.add_argument("--max", type=int, default=None, help="stop after this many papers")
 
     p5 = sub.add_parser("keyword")
     p5.add_argument("keyword")
     p5.add_argument("--limit", type=int, default=20)
 
+    p6 = sub.add_parser("multi", help='JSON list such as [{"cmd": "recent", "category": "cs.LG"}, {"cmd": "author", "author_name": "...", "max": 50}]')
+    p6.add_argument("queries", help="JSON list of queries, or - to read it from stdin")
+
+    p7 = sub.add_parser("getmany")
+    p7.add_argument("--ids", required=True, type=lambda v: [i.strip() for i in v.split(",") if i.strip()],
+                    help="comma-separated arXiv ids, fetched with BatchGetItem in chunks of 100")
+    p7.add_argument("--fields", type=parse_fields, default=None,
+                    help="comma-separated attributes to return (default: all)")
+
+    for p in (p1, p2, p4, p5):
+        p.add_argument("--fields", type=parse_fields, default=LEAN_FIELDS,
+                       help=f"comma-separated attributes to return, or 'all' (default: {','.join(LEAN_FIELDS)}); "
+                            "anything beyond those is read from the full paper items")
+    p3.add_argument("--fields", type=parse_fields, default=None,
+                    help="comma-separated attributes to return (default: all)")
+    for p in (p2, p4, p5):
+        p.add_argument("--count-only", action="store_true",
+                       help="print only the number of matching papers (ignores --limit/--max/--fields)")
+
     return ap.parse_args()
 
 def main():
+    argv = sys.argv[1:]
+    if len(argv) == 2 and argv[0] == "get" and not argv[1].startswith("-"):
+        out(get_paper_by_id(DEFAULT_TABLE, argv[1], DEFAULT_REGION))
+        return
     args = parse_args()
-    if args.cmd == "recent":
-        out(query_recent_in_category(args.table, args.category, args.limit, args.region))
-    elif args.cmd == "author":
-        out(query_papers_by_author(args.table, args.author_name, args.region))
-    elif args.cmd == "get":
-        out(get_paper_by_id(args.table, args.arxiv_id, args.region))
-    elif args.cmd == "daterange":
-        out(query_papers_in_date_range(args.table, args.category, args.start_date, args.end_date, args.region))
-    elif args.cmd == "keyword":
-        out(query_papers_by_keyword(args.table, args.keyword, args.limit, args.region))
+    set_cache_ttl(0 if args.no_cache else args.cache_ttl)
+    params = vars(args)
+    cmd = params.pop("cmd")
+    del params["cache_ttl"], params["no_cache"]
+    if cmd == "multi":
+        queries = json.loads(sys.stdin.read() if args.queries == "-" else args.queries)
+        out(run_multi(args.table, queries, args.region))
+    elif cmd == "getmany":
+        out(get_papers_by_ids(args.table, args.ids, args.region, args.fields))
+    elif params.get("count_only"):
+        out(_run_query(cmd, **params))
+    else:
+        t0 = time.perf_counter_ns()
+        params.pop("count_only", None)
+        out_stream(*_iter_query(cmd, **params), t0)
 
 if __name__ == "__main__":
     main()